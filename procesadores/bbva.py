@@ -1,13 +1,13 @@
-from dataclasses import asdict
-import json
 import logging
 import re
-import pdfplumber
 from typing import Dict, Tuple, List
 from .base import ProcesadorBase, Transaccion
 import os
 
-logger = logging.getLogger(__name__)
+# Patrones compilados una sola vez a nivel de módulo
+_PATRON_FECHA = re.compile(r'^\d{2}/\w{3}\b')
+_PATRON_FECHA_INICIO = re.compile(r'^(\d{2}/\w{3})')
+_PATRON_MONTO = re.compile(r'[\d,]+\.\d{2}')
 
 class ProcesadorBBVA(ProcesadorBase):
     # Constantes para identificar secciones
@@ -17,31 +17,33 @@ class ProcesadorBBVA(ProcesadorBase):
     # Constantes para tipos de transacciones
     CONCEPTOS_DEPOSITO = ["RECIBIDO", "DEPOSITO", "INTERESES GANADOS", "COMPENSACION"]
     CONCEPTOS_RETIRO = ["ENVIADO", "TRASPASO A TERCEROS", "TRASPASO ENTRE CUENTAS"]
+    # Una sola alternación por tipo: el concepto se recorre una vez en lugar de una por palabra clave
+    _REGEX_DEPOSITO = re.compile('|'.join(map(re.escape, CONCEPTOS_DEPOSITO)))
+    _REGEX_RETIRO = re.compile('|'.join(map(re.escape, CONCEPTOS_RETIRO)))
     
     # Constantes para patrones de expresiones regulares
-    PATRON_FECHA = r'^\d{2}/\w{3}\b'
-    PATRON_MONTO = r'[\d,]+\.\d{2}'
     PATRON_CARGO = r'\s+([\d,]+\.\d{2})\s+(?:\d{1,3}(?:,\d{3})*\.\d{2}){2}$'
     PATRON_ABONO = r'\s+(?:\d{1,3}(?:,\d{3})*\.\d{2})\s+([\d,]+\.\d{2})\s+\d{1,3}(?:,\d{3})*\.\d{2}$'
+    # Versiones compiladas, para no pasar por la caché de re en cada llamada
+    _REGEX_CARGO = re.compile(PATRON_CARGO)
+    _REGEX_ABONO = re.compile(PATRON_ABONO)
 
     def __init__(self, logger: logging.Logger):
         super().__init__(logger)
-        self.patron_fecha = re.compile(self.PATRON_FECHA)
-        self.patron_monto = re.compile(self.PATRON_MONTO)
         self.es_seccion_movimientos = False
 
-    def _es_concepto_retiro(self, concepto: str) -> bool:
-        return any(keyword in concepto.upper() for keyword in self.CONCEPTOS_RETIRO)
+    def _es_concepto_retiro(self, concepto_upper: str) -> bool:
+        return self._REGEX_RETIRO.search(concepto_upper) is not None
 
-    def _es_concepto_deposito(self, concepto: str) -> bool:
-        return any(keyword in concepto.upper() for keyword in self.CONCEPTOS_DEPOSITO)
+    def _es_concepto_deposito(self, concepto_upper: str) -> bool:
+        return self._REGEX_DEPOSITO.search(concepto_upper) is not None
 
     def _es_fecha(self, linea: str) -> bool:
-        return bool(self.patron_fecha.match(linea))
+        return bool(_PATRON_FECHA.match(linea))
 
     def _procesar_linea_montos(self, linea: str, concepto: str) -> Tuple[str | None, str | None, str | None]:
-        montos = self.patron_monto.findall(linea)
-        self.logger.info(f"Procesando montos: {montos}")
+        montos = _PATRON_MONTO.findall(linea)
+        self.logger.debug("Procesando montos: %s", montos)
         
         retiro = None
         deposito = None
@@ -50,137 +52,156 @@ class ProcesadorBBVA(ProcesadorBase):
         # Procesar montos según las reglas de BBVA
         if montos:
             # Verificar primero en la columna CARGOS
-            cargo_match = re.search(self.PATRON_CARGO, linea)
+            cargo_match = self._REGEX_CARGO.search(linea)
             if cargo_match:
                 retiro = cargo_match.group(1)
-                self.logger.info(f"Monto encontrado en columna CARGOS: {retiro}")
+                self.logger.debug("Monto encontrado en columna CARGOS: %s", retiro)
             else:
                 # Verificar en la columna ABONOS
-                abono_match = re.search(self.PATRON_ABONO, linea)
+                abono_match = self._REGEX_ABONO.search(linea)
                 if abono_match:
                     deposito = abono_match.group(1)
-                    self.logger.info(f"Monto encontrado en columna ABONOS: {deposito}")
+                    self.logger.debug("Monto encontrado en columna ABONOS: %s", deposito)
             
             # El último monto siempre es el saldo
             saldo = montos[-1]
-            self.logger.info(f"Saldo encontrado: {saldo}")
+            self.logger.debug("Saldo encontrado: %s", saldo)
         
         return retiro, deposito, saldo
 
+    def _seccion_abierta_al_final(self, texto: str, abierta: bool) -> bool:
+        """Reproduce sobre el texto de sondeo cómo procesar_pdf abre y cierra la sección en una página"""
+        posicion = 0
+        while True:
+            if abierta:
+                # Tras el total de movimientos procesar_pdf ya no lee el resto de la página
+                return self.FIN_MOVIMIENTOS not in texto[posicion:]
+            posicion = texto.find(self.INICIO_MOVIMIENTOS, posicion)
+            if posicion < 0:
+                return False
+            abierta = True
+            posicion += len(self.INICIO_MOVIMIENTOS)
+    
+    def _paginas_a_extraer(self, ruta_pdf: str) -> List[int] | None:
+        """Páginas en que la sección de movimientos está abierta o se abre; None para extraer todas"""
+        textos = self._sondear_textos_paginas(ruta_pdf)
+        # Sin sonda, o si la sonda no encuentra ningún inicio (texto ilegible para pypdfium2), no se descarta nada
+        if textos is None or not any(self.INICIO_MOVIMIENTOS in texto for texto in textos):
+            return None
+        # Con la sección cerrada procesar_pdf solo busca el inicio; una página sin él no aporta nada
+        paginas = []
+        abierta = False
+        for num_pagina, texto in enumerate(textos, 1):
+            if abierta or self.INICIO_MOVIMIENTOS in texto:
+                paginas.append(num_pagina)
+            abierta = self._seccion_abierta_al_final(texto, abierta)
+        return paginas
+    
     def procesar_pdf(self, ruta_pdf: str) -> Dict:
         transacciones = []
         transaccion_actual = None
         lineas_concepto = []
         
         self.logger.info("\n" + "="*80)
-        self.logger.info(f"INICIANDO PROCESAMIENTO DEL ARCHIVO: {os.path.basename(ruta_pdf)}")
+        self.logger.info("INICIANDO PROCESAMIENTO DEL ARCHIVO: %s", os.path.basename(ruta_pdf))
         self.logger.info("="*80)
         
-        with pdfplumber.open(ruta_pdf) as pdf:
-            self.es_seccion_movimientos = False
+        self.es_seccion_movimientos = False
+        # Métodos y constantes usados en cada línea, resueltos una sola vez fuera del ciclo
+        inicio_movimientos = self.INICIO_MOVIMIENTOS
+        fin_movimientos = self.FIN_MOVIMIENTOS
+        buscar_fecha = _PATRON_FECHA_INICIO.match
+        buscar_montos = _PATRON_MONTO.findall
+        debug = self.logger.debug
+        
+        # Portada, avisos legales y páginas ya pasado el total de movimientos no se extraen con layout
+        paginas = self._paginas_a_extraer(ruta_pdf)
+        if paginas is not None:
+            self.logger.info("Páginas con movimientos: %s", paginas)
+        
+        for num_pagina, texto in self._extraer_textos_paginas(ruta_pdf, paginas):
+            debug("\n" + "-"*80)
+            debug("PROCESANDO PÁGINA %s", num_pagina)
+            debug("-"*80)
             
-            for num_pagina, pagina in enumerate(pdf.pages, 1):
-                texto = pagina.extract_text(layout=True)
-                self.logger.info("\n" + "-"*80)
-                self.logger.info(f"PROCESANDO PÁGINA {num_pagina}")
-                self.logger.info("-"*80)
+            for linea in texto.splitlines():
+                # Fuera de la sección solo interesa el inicio; el resto se descarta antes del strip
+                if not self.es_seccion_movimientos and inicio_movimientos not in linea:
+                    continue
+                linea = linea.strip()
                 
-                lineas = texto.split('\n')
-                for linea in lineas:
-                    linea = linea.strip()
+                # Verificar inicio y fin de sección de movimientos
+                if inicio_movimientos in linea:
+                    self.es_seccion_movimientos = True
+                    debug("\n>>> INICIO DE SECCIÓN DE MOVIMIENTOS DETECTADO <<<")
+                    continue
                     
-                    # Verificar inicio y fin de sección de movimientos
-                    if self.INICIO_MOVIMIENTOS in linea:
-                        self.es_seccion_movimientos = True
-                        self.logger.info("\n>>> INICIO DE SECCIÓN DE MOVIMIENTOS DETECTADO <<<")
-                        continue
-                        
-                    if self.FIN_MOVIMIENTOS in linea:
-                        self.es_seccion_movimientos = False
-                        self.logger.info("\n>>> FIN DE SECCIÓN DE MOVIMIENTOS DETECTADO <<<")
-                        break
+                if fin_movimientos in linea:
+                    self.es_seccion_movimientos = False
+                    debug("\n>>> FIN DE SECCIÓN DE MOVIMIENTOS DETECTADO <<<")
+                    break
+                
+                # Detectar línea de fecha (DD/MMM); la mayoría son líneas de concepto y no llegan al regex
+                fecha_match = buscar_fecha(linea) if linea[2:3] == '/' and linea[:2].isdigit() else None
+                if fecha_match:
+                    # Si hay una transacción en proceso, guardarla
+                    if transaccion_actual:
+                        transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
+                        debug("----- Fin de transacción anterior -----")
+                        debug("%s", transaccion_actual)
+                        transacciones.append(transaccion_actual)
                     
-                    if not self.es_seccion_movimientos:
-                        continue
+                    debug("\n***** NUEVA TRANSACCIÓN DETECTADA *****")
+                    fecha = fecha_match.group(1)
+                    debug("Fecha encontrada: %s", fecha)
                     
-                    # Detectar línea de fecha (DD/MMM)
-                    fecha_match = re.match(r'^(\d{2}/\w{3})', linea)
-                    if fecha_match:
-                        # Si hay una transacción en proceso, guardarla
-                        if transaccion_actual:
-                            transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
-                            self.logger.info("----- Fin de transacción anterior -----")
-                            self.logger.info(json.dumps(asdict(transaccion_actual), indent=2, ensure_ascii=False))
-                            transacciones.append(transaccion_actual)
-                        
-                        self.logger.info("\n***** NUEVA TRANSACCIÓN DETECTADA *****")
-                        fecha = fecha_match.group(1)
-                        self.logger.info(f"Fecha encontrada: {fecha}")
-                        
-                        # Extraer montos
-                        montos = re.findall(r'[\d,]+\.\d{2}', linea)
-                        self.logger.info(f"Montos encontrados en línea: {montos}")
-                        
-                        retiro = deposito = saldo = None
-                        if montos:
-                            # El primer monto puede ser cargo o abono
-                            if len(montos) >= 1:
-                                if self._es_concepto_retiro(linea):
-                                    retiro = montos[0]
-                                    self.logger.info(f"Monto clasificado como RETIRO: {retiro}")
-                                elif self._es_concepto_deposito(linea):
-                                    deposito = montos[0]
-                                    self.logger.info(f"Monto clasificado como DEPÓSITO: {deposito}")
-                            
-                            # El último monto es el saldo
-                            if len(montos) > 1:
-                                saldo = montos[-1]
-                                self.logger.info(f"Saldo identificado: {saldo}")
-                        
-                        # Crear nueva transacción
-                        transaccion_actual = Transaccion(
-                            fecha=fecha,
-                            concepto='',  # Se llenará con las líneas siguientes
-                            retiro=retiro,
-                            deposito=deposito,
-                            saldo=saldo,
-                            pagina=num_pagina
-                        )
-                        
-                        # Iniciar recolección de concepto
-                        concepto_inicial = linea[7:].strip()  # Después de la fecha
-                        self.logger.info(f"Concepto inicial: {concepto_inicial}")
-                        lineas_concepto = [concepto_inicial]
+                    # Extraer montos
+                    montos = buscar_montos(linea)
+                    debug("Montos encontrados en línea: %s", montos)
+                    
+                    retiro = deposito = saldo = None
+                    if montos:
+                        # El primer monto puede ser cargo o abono
+                        if len(montos) >= 1:
+                            linea_upper = linea.upper()
+                            if self._es_concepto_retiro(linea_upper):
+                                retiro = montos[0]
+                                debug("Monto clasificado como RETIRO: %s", retiro)
+                            elif self._es_concepto_deposito(linea_upper):
+                                deposito = montos[0]
+                                debug("Monto clasificado como DEPÓSITO: %s", deposito)
                         
-                    elif transaccion_actual and linea:
-                        self.logger.info(f"Agregando línea adicional al concepto: {linea}")
-                        lineas_concepto.append(linea)
-                
-                self.logger.info(f"\nFin del procesamiento de página {num_pagina}")
+                        # El último monto es el saldo
+                        if len(montos) > 1:
+                            saldo = montos[-1]
+                            debug("Saldo identificado: %s", saldo)
+                    
+                    # Crear nueva transacción
+                    transaccion_actual = Transaccion(
+                        fecha=fecha,
+                        concepto='',  # Se llenará con las líneas siguientes
+                        retiro=retiro,
+                        deposito=deposito,
+                        saldo=saldo,
+                        pagina=num_pagina
+                    )
+                    
+                    # Iniciar recolección de concepto
+                    concepto_inicial = linea[7:].strip()  # Después de la fecha
+                    debug("Concepto inicial: %s", concepto_inicial)
+                    lineas_concepto = [concepto_inicial]
+                    
+                elif transaccion_actual and linea:
+                    debug("Agregando línea adicional al concepto: %s", linea)
+                    lineas_concepto.append(linea)
+            
+            debug("\nFin del procesamiento de página %s", num_pagina)
         
         # Agregar última transacción si existe
         if transaccion_actual:
             transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
-            self.logger.info("----- Guardando última transacción -----")
-            self.logger.info(json.dumps(asdict(transaccion_actual), indent=2, ensure_ascii=False))
+            debug("----- Guardando última transacción -----")
+            debug("%s", transaccion_actual)
             transacciones.append(transaccion_actual)
         
-        self.logger.info("\n" + "="*80)
-        self.logger.info("RESUMEN FINAL")
-        self.logger.info("="*80)
-        
-        if not transacciones:
-            self.logger.warning("¡No se encontraron transacciones en el documento!")
-        else:
-            self.logger.info(f"Total de transacciones encontradas: {len(transacciones)}")
-        
-        estadisticas = self._calcular_estadisticas(transacciones)
-        self.logger.info("\nEstadísticas del estado de cuenta:")
-        self.logger.info(json.dumps(estadisticas, indent=2, ensure_ascii=False))
-        
-        return {
-            "estado_cuenta": {
-                "movimientos": [asdict(t) for t in transacciones],
-                "estadisticas": estadisticas
-            }
-        }
\ No newline at end of file
+        return self._construir_resultado(transacciones)
\ No newline at end of file
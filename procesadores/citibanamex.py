@@ -1,12 +1,17 @@
-from dataclasses import asdict
-import json
 import logging
 import re
-import pdfplumber
 from typing import Dict, Tuple, List
 from .base import ProcesadorBase, Transaccion
 
-logger = logging.getLogger(__name__)
+# Patrones compilados una sola vez a nivel de módulo
+_PATRON_MONTO = re.compile(r'[\d,]+\.\d{2}')
+# Identificador de página, HORA SUC del pie y fecha de transacción, resueltos con un solo match por línea
+_PATRON_TIPO_LINEA = re.compile(
+    r'^(?:(?P<identificador>\d+\.(?:[A-Z]|[0-9])+\.(?:[A-Z]|[0-9])+\.\d+\.\d+)$'
+    r'|(?P<hora_suc>HORA\s+\d{2}:\d{2}\s+SUC\s+\d{4})$'
+    r'|(?P<fecha>\d{2}\s+[A-Z]{3}\b))'
+)
+_PATRON_ENCABEZADO_COLUMNAS = re.compile(r'^FECHA\s+CONCEPTO\s+RETIROS\s+DEPOSITOS\s+SALDO$')
 
 class ProcesadorCitibanamex(ProcesadorBase):
     # Constantes para conceptos especiales
@@ -14,6 +19,11 @@ class ProcesadorCitibanamex(ProcesadorBase):
     SALDO_MINIMO_REQUERIDO = "SALDO MINIMO REQUERIDO"
     DETALLE_OPERACIONES = "DETALLE DE OPERACIONES"
 
+    # Constantes para tipos de línea (nombres de grupo de _PATRON_TIPO_LINEA)
+    LINEA_IDENTIFICADOR = "identificador"
+    LINEA_HORA_SUC = "hora_suc"
+    LINEA_FECHA = "fecha"
+
     # Constantes para tipos de transacciones
     CONCEPTOS_DEPOSITO = [
         "PAGO RECIBIDO",
@@ -30,66 +40,63 @@ class ProcesadorCitibanamex(ProcesadorBase):
         "IVA POR COMISION COBRADA",
         "COBRO DE CHEQUE"
     ]
+    # Tuplas para que str.startswith pruebe todas las palabras clave en una sola llamada
+    _PREFIJOS_DEPOSITO = tuple(CONCEPTOS_DEPOSITO)
+    _PREFIJOS_RETIRO = tuple(CONCEPTOS_RETIRO)
 
     def __init__(self, logger: logging.Logger):
         super().__init__(logger)
-        self.patron_fecha = re.compile(r'^\d{2}\s+[A-Z]{3}\b')
-        self.patron_monto = re.compile(r'[\d,]+\.\d{2}')
-        self.patron_identificador_pagina = re.compile(r'^\d+\.([A-Z]|[0-9])+\.([A-Z]|[0-9])+\.\d+\.\d+$')
-        self.patron_encabezado_columnas = re.compile(r'^FECHA\s+CONCEPTO\s+RETIROS\s+DEPOSITOS\s+SALDO$')
-        self.patron_hora_suc = re.compile(r'^HORA\s+\d{2}:\d{2}\s+SUC\s+\d{4}$')
         self.ignorar_lineas = False
 
-    def _es_fecha(self, linea: str) -> bool:
-        return bool(self.patron_fecha.match(linea))
-
-    def _es_identificador_pagina(self, linea: str) -> bool:
-        return bool(self.patron_identificador_pagina.match(linea.strip()))
+    def _clasificar_linea(self, linea: str) -> str | None:
+        """Retorna el tipo de línea (LINEA_*) o None si es una línea de concepto o montos"""
+        # Prefiltro: todos los tipos empiezan con dígito o con HORA, el resto no pasa por el regex
+        if not (linea[:1].isdigit() or linea.startswith('HORA')):
+            return None
+        match = _PATRON_TIPO_LINEA.match(linea)
+        return match.lastgroup if match else None
 
-    def _es_concepto_retiro(self, concepto: str) -> bool:
-        """Verifica si el concepto comienza con alguna de las palabras clave de retiro"""
-        concepto_upper = concepto.upper()
-        return any(concepto_upper.startswith(keyword) for keyword in self.CONCEPTOS_RETIRO)
+    def _es_concepto_retiro(self, concepto_upper: str) -> bool:
+        """Verifica si el concepto (en mayúsculas) comienza con alguna de las palabras clave de retiro"""
+        return concepto_upper.startswith(self._PREFIJOS_RETIRO)
 
-    def _es_concepto_deposito(self, concepto: str) -> bool:
-        """Verifica si el concepto comienza con alguna de las palabras clave de depósito"""
-        concepto_upper = concepto.upper()
-        return any(concepto_upper.startswith(keyword) for keyword in self.CONCEPTOS_DEPOSITO)
+    def _es_concepto_deposito(self, concepto_upper: str) -> bool:
+        """Verifica si el concepto (en mayúsculas) comienza con alguna de las palabras clave de depósito"""
+        return concepto_upper.startswith(self._PREFIJOS_DEPOSITO)
 
-    def _procesar_linea_montos(self, linea: str, concepto: str) -> Tuple[str | None, str | None, str | None]:
-        montos = self.patron_monto.findall(linea)
-        self.logger.info(f"Procesando montos: {montos}")
+    def _procesar_linea_montos(self, montos: List[str], concepto_upper: str) -> Tuple[str | None, str | None, str | None]:
+        self.logger.debug("Procesando montos: %s", montos)
         
         retiro = None
         deposito = None
         saldo = None
         
         # Nueva validación para NUMERO DE CHEQUES EXENTOS
-        if concepto.upper().startswith(self.NUMERO_CHEQUES_EXENTOS):
+        if concepto_upper.startswith(self.NUMERO_CHEQUES_EXENTOS):
             if montos:
                 saldo = montos[0]
-                self.logger.info(f"Monto asignado como saldo por regla {self.NUMERO_CHEQUES_EXENTOS}: {saldo}")
+                self.logger.debug("Monto asignado como saldo por regla %s: %s", self.NUMERO_CHEQUES_EXENTOS, saldo)
                 return retiro, deposito, saldo
         
         # Aplicamos las reglas de negocio basadas en el concepto
-        if self._es_concepto_deposito(concepto):
+        if self._es_concepto_deposito(concepto_upper):
             if montos:
                 deposito = montos[0]
-                self.logger.info(f"Monto asignado como depósito por regla de negocio: {deposito}")
-        elif self._es_concepto_retiro(concepto):
+                self.logger.debug("Monto asignado como depósito por regla de negocio: %s", deposito)
+        elif self._es_concepto_retiro(concepto_upper):
             if montos:
                 retiro = montos[0]
-                self.logger.info(f"Monto asignado como retiro por regla de negocio: {retiro}")
+                self.logger.debug("Monto asignado como retiro por regla de negocio: %s", retiro)
         else:
             # Si no hay reglas específicas y hay un solo monto, se considera retiro por defecto
             if len(montos) == 1:
                 retiro = montos[0]
-                self.logger.info(f"Monto asignado como retiro por defecto: {retiro}")
+                self.logger.debug("Monto asignado como retiro por defecto: %s", retiro)
         
         # El último monto siempre es el saldo cuando hay más de un monto
         if len(montos) > 1:
             saldo = montos[-1]
-            self.logger.info(f"Último monto asignado como saldo: {saldo}")
+            self.logger.debug("Último monto asignado como saldo: %s", saldo)
         
         return retiro, deposito, saldo
 
@@ -97,110 +104,113 @@ class ProcesadorCitibanamex(ProcesadorBase):
         transacciones = []
         transaccion_actual = None
         lineas_concepto = []
+        # Mayúsculas del concepto actual, calculadas solo cuando una línea de montos las necesita
+        # (None indica además que hay líneas de concepto pendientes de unir)
+        concepto_upper = None
+        # Métodos y constantes usados en cada línea, resueltos una sola vez fuera del ciclo
+        clasificar_linea = self._clasificar_linea
+        buscar_montos = _PATRON_MONTO.findall
+        es_encabezado_columnas = _PATRON_ENCABEZADO_COLUMNAS.match
+        debug = self.logger.debug
         
-        with pdfplumber.open(ruta_pdf) as pdf:
-            for num_pagina, pagina in enumerate(pdf.pages, 1):
-                texto = pagina.extract_text(layout=True)
-                self.logger.info('='*80)
-                self.logger.info(f"Procesando página {num_pagina}")
-                self.logger.info('='*80)
+        for num_pagina, texto in self._extraer_textos_paginas(ruta_pdf):
+            debug('='*80)
+            debug("Procesando página %s", num_pagina)
+            debug('='*80)
+            
+            for linea in texto.splitlines():
+                linea = linea.strip()
                 
-                for linea in texto.split('\n'):
-                    linea = linea.strip()
-                    
-                    # Ignorar líneas de pie de página
-                    if self._es_identificador_pagina(linea):
-                        self.logger.info("Detectado identificador de página - Iniciando modo ignorar")
-                        self.ignorar_lineas = True
+                tipo_linea = clasificar_linea(linea)
+                
+                # Ignorar líneas de pie de página
+                if tipo_linea == self.LINEA_IDENTIFICADOR:
+                    debug("Detectado identificador de página - Iniciando modo ignorar")
+                    self.ignorar_lineas = True
+                    continue
+                
+                if self.ignorar_lineas:
+                    if self.DETALLE_OPERACIONES in linea:
+                        debug("Encontrado DETALLE DE OPERACIONES")
                         continue
+                    # El encabezado empieza con FECHA; startswith descarta el resto sin pasar por el regex
+                    elif linea.startswith('FECHA') and es_encabezado_columnas(linea):
+                        debug("Encontrado encabezado de columnas - Finalizando modo ignorar")
+                        self.ignorar_lineas = False
+                    continue
+                
+                # Ignorar líneas de HORA SUC que aparecen al pie
+                if tipo_linea == self.LINEA_HORA_SUC:
+                    debug("Ignorando línea de HORA SUC: %s", linea)
+                    continue
+                
+                if tipo_linea == self.LINEA_FECHA:
+                    if transaccion_actual:
+                        transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
+                        debug("----- Fin de transacción -----")
+                        debug("%s", transaccion_actual)
+                        transacciones.append(transaccion_actual)
                     
-                    if self.ignorar_lineas:
-                        if self.DETALLE_OPERACIONES in linea:
-                            self.logger.info("Encontrado DETALLE DE OPERACIONES")
-                            continue
-                        elif self.patron_encabezado_columnas.match(linea):
-                            self.logger.info("Encontrado encabezado de columnas - Finalizando modo ignorar")
-                            self.ignorar_lineas = False
-                        continue
+                    debug("★★★★★ NUEVA TRANSACCIÓN DETECTADA ★★★★★")
+                    # La línea ya viene sin espacios en los extremos
+                    fecha = linea[:7].strip()
+                    concepto = linea[7:].strip()
                     
-                    # Ignorar líneas de HORA SUC que aparecen al pie
-                    if self.patron_hora_suc.match(linea):
-                        self.logger.info(f"Ignorando línea de HORA SUC: {linea}")
-                        continue
+                    debug("Fecha encontrada: %s", fecha)
+                    debug("Concepto inicial: %s", concepto)
                     
-                    if self._es_fecha(linea):
-                        if transaccion_actual:
-                            self.logger.info("----- Fin de transacción -----")
-                            self.logger.info(json.dumps(asdict(transaccion_actual), indent=2, ensure_ascii=False))
-                            transacciones.append(transaccion_actual)
-                        
-                        self.logger.info("★★★★★ NUEVA TRANSACCIÓN DETECTADA ★★★★★")
-                        linea_limpia = linea.strip()
-                        fecha = linea_limpia[:7].strip()
-                        concepto = linea_limpia[7:].strip()
+                    transaccion_actual = Transaccion(
+                        fecha=fecha.replace("  ", " "),
+                        concepto=concepto,
+                        retiro=None,
+                        deposito=None,
+                        saldo=None,
+                        pagina=num_pagina
+                    )
+                    lineas_concepto = [concepto]
+                    concepto_upper = None
+                    
+                elif transaccion_actual:
+                    # Un solo findall por línea; la lista se reutiliza para clasificar los montos.
+                    # Sin punto decimal no puede haber montos, así que se evita el regex
+                    montos = buscar_montos(linea) if '.' in linea else []
+                    if montos:
+                        # El concepto solo se arma cuando cambió desde la última línea de montos
+                        if concepto_upper is None:
+                            transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
+                            concepto_upper = transaccion_actual.concepto.upper()
                         
-                        self.logger.info(f"Fecha encontrada: {fecha}")
-                        self.logger.info(f"Concepto inicial: {concepto}")
+                        debug(">>> Validación de montos <<<")
+                        debug("Línea analizada: %s", linea)
+                        debug("Aplicando reglas de negocio para concepto: %s", transaccion_actual.concepto)
                         
-                        transaccion_actual = Transaccion(
-                            fecha=fecha.replace("  ", " "),
-                            concepto=concepto,
-                            retiro=None,
-                            deposito=None,
-                            saldo=None,
-                            pagina=num_pagina
+                        retiro, deposito, saldo = self._procesar_linea_montos(
+                            montos, 
+                            concepto_upper
                         )
-                        lineas_concepto = [concepto]
                         
-                    elif transaccion_actual:
-                        if self.patron_monto.search(linea):
-                            self.logger.info(">>> Validación de montos <<<")
-                            self.logger.info(f"Línea analizada: {linea}")
-                            self.logger.info(f"Aplicando reglas de negocio para concepto: {transaccion_actual.concepto}")
-                            
-                            retiro, deposito, saldo = self._procesar_linea_montos(
-                                linea, 
-                                transaccion_actual.concepto
-                            )
-                            
-                            if retiro: 
-                                transaccion_actual.retiro = retiro
-                                self.logger.info(f"✓ RETIRO identificado: ${retiro}")
-                            if deposito: 
-                                transaccion_actual.deposito = deposito
-                                self.logger.info(f"✓ DEPÓSITO identificado: ${deposito}")
-                            if saldo: 
-                                transaccion_actual.saldo = saldo
-                                self.logger.info(f"✓ SALDO identificado: ${saldo}")
-                        else:
-                            lineas_concepto.append(linea.strip())
-                            transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
+                        if retiro: 
+                            transaccion_actual.retiro = retiro
+                            debug("✓ RETIRO identificado: $%s", retiro)
+                        if deposito: 
+                            transaccion_actual.deposito = deposito
+                            debug("✓ DEPÓSITO identificado: $%s", deposito)
+                        if saldo: 
+                            transaccion_actual.saldo = saldo
+                            debug("✓ SALDO identificado: $%s", saldo)
+                    else:
+                        # Las líneas se unen una sola vez (al clasificar montos o al cerrar la transacción)
+                        lineas_concepto.append(linea)
+                        concepto_upper = None
+                
+                # Detectar final de la tabla de movimientos
+                if self.SALDO_MINIMO_REQUERIDO in linea:
+                    if transaccion_actual:
+                        transaccion_actual.concepto = ' '.join(lineas_concepto).strip()
+                        debug("----- Fin de última transacción -----")
+                        debug("%s", transaccion_actual)
+                        transacciones.append(transaccion_actual)
                     
-                    # Detectar final de la tabla de movimientos
-                    if self.SALDO_MINIMO_REQUERIDO in linea:
-                        if transaccion_actual:
-                            self.logger.info("----- Fin de última transacción -----")
-                            self.logger.info(json.dumps(asdict(transaccion_actual), indent=2, ensure_ascii=False))
-                            transacciones.append(transaccion_actual)
-                        
-                        self.logger.info("\n" + "="*80)
-                        self.logger.info("RESUMEN FINAL")
-                        self.logger.info("="*80)
-                        
-                        estadisticas = self._calcular_estadisticas(transacciones)
-                        self.logger.info("\nEstadísticas del estado de cuenta:")
-                        self.logger.info(json.dumps(estadisticas, indent=2, ensure_ascii=False))
-                        
-                        return {
-                            "estado_cuenta": {
-                                "movimientos": [asdict(t) for t in transacciones],
-                                "estadisticas": estadisticas
-                            }
-                        }
+                    return self._construir_resultado(transacciones)
         
-        return {
-            "estado_cuenta": {
-                "movimientos": [asdict(t) for t in transacciones],
-                "estadisticas": self._calcular_estadisticas(transacciones)
-            }
-        } 
\ No newline at end of file
+        return self._construir_resultado(transacciones)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict
+from typing import Dict, Type
 from .base import ProcesadorBase
 from .citibanamex import ProcesadorCitibanamex
 from .bbva import ProcesadorBBVA
@@ -9,14 +9,24 @@ class TipoBanco(Enum):
     CITIBANAMEX = "CITIBANAMEX"
     BBVA = "BBVA"
     # Agregar más bancos aquí
-    
+
 class ProcesadorFactory:
-    @staticmethod
-    def crear_procesador(tipo_banco: TipoBanco, logger: logging.Logger) -> ProcesadorBase:
-        if tipo_banco == TipoBanco.CITIBANAMEX:
-            return ProcesadorCitibanamex(logger)
-        elif tipo_banco == TipoBanco.BBVA:
-            return ProcesadorBBVA(logger)
-        # Agregar más casos para otros bancos
-        else:
-            raise ValueError(f"Tipo de banco no soportado: {tipo_banco}") 
\ No newline at end of file
+    # Procesador registrado para cada banco
+    _REGISTRO: Dict[TipoBanco, Type[ProcesadorBase]] = {
+        TipoBanco.CITIBANAMEX: ProcesadorCitibanamex,
+        TipoBanco.BBVA: ProcesadorBBVA,
+        # Agregar más bancos aquí, o registrarlos con ProcesadorFactory.registrar
+    }
+
+    @classmethod
+    def registrar(cls, tipo_banco: TipoBanco, clase_procesador: Type[ProcesadorBase]) -> None:
+        """Registra (o reemplaza) la clase de procesador para un banco"""
+        cls._REGISTRO[tipo_banco] = clase_procesador
+
+    @classmethod
+    def crear_procesador(cls, tipo_banco: TipoBanco, logger: logging.Logger) -> ProcesadorBase:
+        try:
+            clase_procesador = cls._REGISTRO[tipo_banco]
+        except KeyError:
+            raise ValueError(f"Tipo de banco no soportado: {tipo_banco}") from None
+        return clase_procesador(logger)
@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from .base import contexto_multiproceso, cpus_disponibles, nivel_log_configurado
+from .factory import ProcesadorFactory, TipoBanco
+from datetime import datetime
+import argparse
+import glob
+import logging
+import orjson
+import os
+import sys
+
+def _logger_worker() -> logging.Logger:
+    """Logger propio del proceso worker actual"""
+    return logging.getLogger(f"ProcesadorEstadoCuenta.lote.{os.getpid()}")
+
+def _inicializar_worker_lote(directorio_logs: str | None, timestamp: str):
+    """Configura el logger del worker: un archivo por proceso, o stderr con el pid si no hay directorio"""
+    logger = _logger_worker()
+    logger.propagate = False
+    nivel, nivel_invalido = nivel_log_configurado()
+    logger.setLevel(nivel)
+    formato = '%(asctime)s - %(levelname)s - %(message)s'
+    if directorio_logs is not None:
+        # FileHandler normal (vacía en cada registro): los workers pueden terminar sin pasar por logging.shutdown
+        handler = logging.FileHandler(
+            os.path.join(directorio_logs, f"procesamiento_{timestamp}_{os.getpid()}.log"),
+            mode='w',
+            encoding='utf-8'
+        )
+    else:
+        handler = logging.StreamHandler()
+        formato = '%(asctime)s - [%(process)d] %(levelname)s - %(message)s'
+    handler.setFormatter(logging.Formatter(formato))
+    logger.addHandler(handler)
+    if nivel_invalido is not None:
+        logger.warning("NIVEL_LOG inválido: %r; se usa WARNING", nivel_invalido)
+
+def _procesar_archivo(banco: str, ruta_pdf: str) -> Dict:
+    """Procesa un PDF dentro de un proceso worker, con el logger propio del proceso"""
+    logger = _logger_worker()
+    logger.info("Procesando archivo: %s", ruta_pdf)
+    procesador = ProcesadorFactory.crear_procesador(TipoBanco(banco), logger)
+    # Los archivos ya se reparten entre procesos; no anidar otro pool por páginas
+    procesador.paginas_en_paralelo = False
+    try:
+        return procesador.procesar_pdf(ruta_pdf)
+    except Exception:
+        logger.exception("Error al procesar el archivo: %s", ruta_pdf)
+        raise
+
+def iterar_lote(rutas_pdf: List[str], tipo_banco: TipoBanco, max_workers: int | None = None, directorio_logs: str | None = None) -> Iterator[Tuple[str, Dict | None, Exception | None]]:
+    """Procesa varios estados de cuenta en paralelo y genera (ruta, resultado, error) en el orden de entrada"""
+    if not rutas_pdf:
+        return
+    max_workers = min(max_workers or cpus_disponibles(), len(rutas_pdf))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=contexto_multiproceso(),
+        initializer=_inicializar_worker_lote,
+        initargs=(directorio_logs, timestamp)
+    ) as executor:
+        futuros = [executor.submit(_procesar_archivo, tipo_banco.value, ruta_pdf) for ruta_pdf in rutas_pdf]
+        # El error de un archivo se entrega junto con su ruta, sin detener el resto del lote
+        for ruta_pdf, futuro in zip(rutas_pdf, futuros):
+            try:
+                yield ruta_pdf, futuro.result(), None
+            except Exception as e:
+                yield ruta_pdf, None, e
+
+def procesar_lote(rutas_pdf: List[str], tipo_banco: TipoBanco, max_workers: int | None = None, directorio_logs: str | None = None) -> Dict[str, Dict]:
+    """Procesa varios estados de cuenta en paralelo y retorna los resultados por ruta; falla con el primer error"""
+    resultados = {}
+    for ruta_pdf, resultado, error in iterar_lote(rutas_pdf, tipo_banco, max_workers, directorio_logs):
+        if error is not None:
+            raise error
+        resultados[ruta_pdf] = resultado
+    return resultados
+
+def _entero_positivo(valor: str) -> int:
+    """Tipo de argparse para --workers"""
+    try:
+        numero = int(valor)
+    except ValueError:
+        numero = 0
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero positivo: {valor}")
+    return numero
+
+def main():
+    """Procesa todos los PDF de un directorio sin pasar por Streamlit"""
+    parser = argparse.ArgumentParser(description="Procesa en lote los estados de cuenta PDF de un directorio")
+    parser.add_argument("--banco", required=True, choices=[banco.value for banco in TipoBanco])
+    parser.add_argument("--entrada", required=True, help="Directorio con los archivos PDF")
+    parser.add_argument("--salida", required=True, help="Directorio donde se escriben los JSON")
+    parser.add_argument("--workers", type=_entero_positivo, default=None, help="Procesos en paralelo (por defecto, uno por CPU)")
+    args = parser.parse_args()
+
+    rutas_pdf = sorted(glob.glob(os.path.join(args.entrada, "*.pdf")))
+    os.makedirs(args.salida, exist_ok=True)
+
+    # Cada resultado se escribe apenas llega, sin esperar al resto del lote
+    fallidos = 0
+    # Cada worker escribe su log en el directorio de salida (procesamiento_<timestamp>_<pid>.log)
+    for ruta_pdf, resultado, error in iterar_lote(rutas_pdf, TipoBanco(args.banco), args.workers, args.salida):
+        if error is not None:
+            fallidos += 1
+            print(f"{ruta_pdf}: error: {error}", file=sys.stderr)
+            continue
+        file_base = os.path.splitext(os.path.basename(ruta_pdf))[0]
+        json_path = os.path.join(args.salida, f"transacciones_{file_base}.json")
+        with open(json_path, 'wb') as f:
+            f.write(orjson.dumps(resultado, option=orjson.OPT_INDENT_2))
+        print(f"{ruta_pdf} -> {json_path} ({resultado['estado_cuenta']['estadisticas']['numero_transacciones']} transacciones)")
+    
+    if fallidos:
+        print(f"{fallidos} de {len(rutas_pdf)} archivos no se pudieron procesar", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,156 @@
 import streamlit as st
-import pandas as pd
 import tempfile
 import os
+import hashlib
+import shutil
 import logging
-from typing import Dict
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
+from uuid import uuid4
+from dataclasses import fields
 from datetime import datetime
-import json
+import orjson
+from procesadores.base import Transaccion, VERSION_PROCESADORES, motor_pdf, nivel_log_configurado
 from procesadores.factory import ProcesadorFactory, TipoBanco
 
-def setup_logger(log_path: str) -> logging.Logger:
-    """Configura y retorna un logger"""
-    # Remover handlers existentes para evitar duplicación
-    logger = logging.getLogger('ProcesadorEstadoCuenta')
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
+# Columnas de la tabla de movimientos, en el orden de Transaccion
+COLUMNAS_MOVIMIENTOS = [campo.name for campo in fields(Transaccion)]
+# Opciones del selector de banco, calculadas una vez en lugar de recorrer el Enum en cada rerun
+BANCOS_DISPONIBLES = tuple(banco.value for banco in TipoBanco)
+BANCO_POR_VALOR = {banco.value: banco for banco in TipoBanco}
+
+class FileHandlerConBuffer(logging.FileHandler):
+    """FileHandler que escribe a través de un buffer de 64 KB en lugar de vaciar el archivo en cada registro"""
     
-    logger.setLevel(logging.INFO)
+    TAMANO_BUFFER = 64 * 1024
+    
+    def _open(self):
+        # _builtin_open, como FileHandler, para poder abrir el archivo durante la finalización del intérprete
+        return self._builtin_open(self.baseFilename, self.mode, buffering=self.TAMANO_BUFFER, encoding=self.encoding, errors=self.errors)
+    
+    def emit(self, record):
+        # Igual que FileHandler.emit pero sin flush(); el buffer se vacía al llenarse o al cerrar.
+        # Un handler en modo 'w' ya cerrado no se reabre, para no truncar el log (bpo-42378)
+        if self.stream is None:
+            if self.mode != 'w' or not self._closed:
+                self.stream = self._open()
+        if self.stream:
+            try:
+                self.stream.write(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+
+def setup_logger(log_path: str, detallado: bool = False) -> Tuple[logging.Logger, QueueListener]:
+    """Configura y retorna un logger junto con el listener que escribe el archivo"""
+    # Un logger hijo por procesamiento: las sesiones de Streamlit son hilos del mismo proceso y
+    # un logger compartido mezclaría (o quitaría) los handlers de procesamientos simultáneos
+    logger = logging.getLogger(f"ProcesadorEstadoCuenta.{uuid4().hex}")
+    # Los registros solo van al archivo de este procesamiento, no a los handlers del root
+    logger.propagate = False
+    
+    # Nivel configurable vía NIVEL_LOG; el modo detallado fuerza DEBUG (detalle por línea)
+    nivel_invalido = None
+    if detallado:
+        logger.setLevel(logging.DEBUG)
+    else:
+        nivel, nivel_invalido = nivel_log_configurado()
+        logger.setLevel(nivel)
     
     # Solo configurar FileHandler (sin handler de consola)
-    file_handler = logging.FileHandler(log_path, mode='w', encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
+    file_handler = FileHandlerConBuffer(log_path, mode='w', encoding='utf-8')
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
     
-    # En lugar de asignar flush = True, llamamos al método flush() después de cada write
-    original_emit = file_handler.emit
-    def emit_with_flush(record):
-        original_emit(record)
-        file_handler.flush()
-    file_handler.emit = emit_with_flush
+    # El procesamiento solo encola registros; un hilo en segundo plano los escribe a disco
+    cola_log = queue.Queue(-1)
+    logger.addHandler(QueueHandler(cola_log))
+    listener = QueueListener(cola_log, file_handler)
+    listener.start()
+    
+    if nivel_invalido is not None:
+        logger.warning("NIVEL_LOG inválido: %r; se usa WARNING", nivel_invalido)
     
-    logger.addHandler(file_handler)
+    return logger, listener
+
+def cerrar_logger(logger: logging.Logger, listener: QueueListener):
+    """Detiene el listener (vaciando la cola pendiente) y cierra los handlers"""
+    for handler in logger.handlers[:]:
+        handler.close()
+        logger.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    # El logger de este procesamiento no se vuelve a usar; sacarlo del registro de logging evita que se acumulen
+    logging.Logger.manager.loggerDict.pop(logger.name, None)
+
+# Resultados ya procesados, por contenido del PDF, banco, motor y versión; persiste entre reinicios del servidor.
+# Fuera de resources/uploads, donde cada archivo subido crea una carpeta con su propio nombre
+DIRECTORIO_CACHE = "resources/cache"
+# Límites de la caché en disco: número de resultados guardados y antigüedad máxima
+MAX_ARCHIVOS_CACHE = 256
+CADUCIDAD_CACHE_SEGUNDOS = 30 * 24 * 60 * 60
+
+def _ruta_cache(digest: str, banco: str, motor: str) -> str:
+    """Archivo de caché de un resultado; otro motor o versión de procesadores nunca lo reutiliza"""
+    return os.path.join(DIRECTORIO_CACHE, f"{digest}_{banco}_{motor}_v{VERSION_PROCESADORES}.json")
+
+def _podar_cache():
+    """Borra los resultados caducados y, si aún sobran, los más antiguos hasta dejar MAX_ARCHIVOS_CACHE"""
+    limite = datetime.now().timestamp() - CADUCIDAD_CACHE_SEGUNDOS
+    vigentes = []
+    with os.scandir(DIRECTORIO_CACHE) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file():
+                continue
+            try:
+                mtime = entrada.stat().st_mtime
+                if mtime < limite:
+                    os.unlink(entrada.path)
+                else:
+                    vigentes.append((mtime, entrada.path))
+            except FileNotFoundError:
+                # Otra sesión lo borró primero
+                pass
+    vigentes.sort(reverse=True)
+    for _, ruta in vigentes[MAX_ARCHIVOS_CACHE:]:
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+
+def procesar_pdf(digest: str, banco: str, ruta_pdf: str, logger: logging.Logger) -> Dict:
+    """Procesa el PDF sin pasar por la caché en memoria y deja el resultado en la caché en disco"""
+    # El motor se toma antes de procesar, para que la llave corresponda al que realmente se usó
+    ruta_cache = _ruta_cache(digest, banco, motor_pdf())
+    procesador = ProcesadorFactory.crear_procesador(BANCO_POR_VALOR[banco], logger)
+    resultado = procesador.procesar_pdf(ruta_pdf)
     
-    return logger
+    # Escribir a un temporal y renombrar, para que otra sesión nunca lea un archivo a medias
+    os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+    fd, ruta_temporal = tempfile.mkstemp(suffix=".json", dir=DIRECTORIO_CACHE)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(orjson.dumps(resultado))
+    os.replace(ruta_temporal, ruta_cache)
+    _podar_cache()
+    return resultado
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def procesar_pdf_cacheado(digest: str, banco: str, motor: str, _ruta_pdf: str, _logger: logging.Logger, _ejecucion: Dict) -> Dict:
+    """Procesa el PDF; Streamlit reutiliza el resultado si el mismo archivo ya se procesó con el mismo banco y motor"""
+    # Solo digest, banco y motor forman la llave de caché (los parámetros con _ no se hashean).
+    # Si Streamlit reutiliza el resultado esta función no corre y _ejecucion queda sin marcar
+    _ejecucion["procesado"] = True
+    ruta_cache = _ruta_cache(digest, banco, motor)
+    try:
+        vigente = os.path.getmtime(ruta_cache) >= datetime.now().timestamp() - CADUCIDAD_CACHE_SEGUNDOS
+    except FileNotFoundError:
+        vigente = False
+    if vigente:
+        _logger.info("Resultado recuperado de caché: %s", ruta_cache)
+        with open(ruta_cache, 'rb') as f:
+            return orjson.loads(f.read())
+    return procesar_pdf(digest, banco, _ruta_pdf, _logger)
 
 def main():
     st.title("Procesador de Estados de Cuenta")
@@ -42,20 +160,22 @@ def main():
         st.session_state.resultado = None
         st.session_state.df = None
         st.session_state.df_stats = None
+        st.session_state.csv = None
         st.session_state.log_path = None
+        st.session_state.json_path = None
         st.session_state.timestamp = None
     
     # Selector de banco
     banco_seleccionado = st.selectbox(
         "Selecciona el banco",
-        [banco.value for banco in TipoBanco]
+        BANCOS_DISPONIBLES
     )
     
     uploaded_file = st.file_uploader("Selecciona un archivo PDF", type="pdf")
     
+    log_detallado = st.checkbox("Generar log detallado (más lento)")
+    
     if uploaded_file:
-        # Crear directorios base si no existen
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = uploaded_file.name
         file_base = os.path.splitext(filename)[0]
         
@@ -65,11 +185,14 @@ def main():
         logs_dir = os.path.join(file_dir, "logs")
         output_dir = os.path.join(file_dir, "output")
         
-        for dir_path in [temp_dir, logs_dir, output_dir]:
-            os.makedirs(dir_path, exist_ok=True)
-        
         # Agregar botón de procesar
         if st.button("Procesar Estado de Cuenta"):
+            # Crear directorios base si no existen (solo al procesar, no en cada rerun)
+            for dir_path in [temp_dir, logs_dir, output_dir]:
+                os.makedirs(dir_path, exist_ok=True)
+            
+            # Si algo falla antes de crearlos, la limpieza no debe intentar usarlos
+            logger = listener = temp_path = None
             try:
                 # Guardar timestamp
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -78,46 +201,68 @@ def main():
                 # Configurar logger y guardar path
                 log_path = os.path.join(logs_dir, f"procesamiento_{timestamp}.log")
                 st.session_state.log_path = log_path
-                logger = setup_logger(log_path)
-                logger.info(f"Iniciando procesamiento del archivo: {filename}")
+                logger, listener = setup_logger(log_path, detallado=log_detallado)
+                logger.info("Iniciando procesamiento del archivo: %s", filename)
                 
-                # Guardar archivo temporal
-                temp_path = os.path.join(temp_dir, f"temp_{timestamp}.pdf")
-                with open(temp_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
+                # Guardar archivo temporal copiando por bloques, sin duplicar el PDF completo en memoria
+                # mkstemp garantiza un nombre único aunque dos sesiones suban el mismo archivo en el mismo segundo
+                fd, temp_path = tempfile.mkstemp(prefix=f"temp_{timestamp}_", suffix=".pdf", dir=temp_dir)
+                uploaded_file.seek(0)
+                with os.fdopen(fd, "wb") as f:
+                    shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
                 
-                # Procesar archivo
+                # Procesar archivo (o reutilizar el resultado si ya se procesó el mismo contenido)
+                digest = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
                 with st.spinner('Procesando archivo...'):
-                    procesador = ProcesadorFactory.crear_procesador(
-                        TipoBanco(banco_seleccionado),
-                        logger
-                    )
-                    resultado = procesador.procesar_pdf(temp_path)
+                    if log_detallado:
+                        # El log detallado solo existe si el PDF realmente se procesa; nunca pasa por la caché
+                        resultado = procesar_pdf(digest, banco_seleccionado, temp_path, logger)
+                    else:
+                        ejecucion = {}
+                        resultado = procesar_pdf_cacheado(
+                            digest,
+                            banco_seleccionado,
+                            motor_pdf(),
+                            temp_path,
+                            logger,
+                            ejecucion
+                        )
+                        if not ejecucion:
+                            logger.info("Resultado reutilizado de la caché en memoria (digest %s, banco %s)", digest, banco_seleccionado)
                 
                 # Guardar resultado en JSON
                 json_path = os.path.join(output_dir, f"transacciones_{timestamp}.json")
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(resultado, f, ensure_ascii=False, indent=2)
+                with open(json_path, 'wb') as f:
+                    f.write(orjson.dumps(resultado, option=orjson.OPT_INDENT_2))
+                
+                # pandas solo se carga cuando hay resultados que mostrar, no al arrancar la app
+                import pandas as pd
                 
                 # Guardar en session_state
                 st.session_state.resultado = resultado
-                st.session_state.df = pd.DataFrame(resultado["estado_cuenta"]["movimientos"])
+                st.session_state.json_path = json_path
+                # Con columnas explícitas pandas no tiene que descubrir las llaves recorriendo cada registro
+                st.session_state.df = pd.DataFrame.from_records(
+                    resultado["estado_cuenta"]["movimientos"],
+                    columns=COLUMNAS_MOVIMIENTOS
+                )
                 st.session_state.df_stats = pd.DataFrame([resultado["estado_cuenta"]["estadisticas"]])
+                # El CSV se genera una sola vez por procesamiento, no en cada rerun de la página
+                st.session_state.csv = st.session_state.df.to_csv(index=False).encode('utf-8')
                 
             except Exception as e:
                 error_msg = f"Error al procesar el archivo: {str(e)}"
-                logger.error(error_msg, exc_info=True)
+                if logger is not None:
+                    logger.error(error_msg, exc_info=True)
                 st.error(error_msg)
             finally:
                 # Limpiar archivo temporal
-                if os.path.exists(temp_path):
+                if temp_path is not None and os.path.exists(temp_path):
                     os.unlink(temp_path)
-                logger.info("Procesamiento finalizado")
-                # Cerrar handlers del logger
-                for handler in logger.handlers[:]:
-                    handler.flush()
-                    handler.close()
-                    logger.removeHandler(handler)
+                if logger is not None:
+                    logger.info("Procesamiento finalizado")
+                    # Cerrar handlers del logger y escribir los registros pendientes
+                    cerrar_logger(logger, listener)
 
     # Mostrar resultados si existen
     if st.session_state.resultado is not None:
@@ -132,33 +277,33 @@ def main():
         st.write("Descargar resultados:")
         col1, col2, col3 = st.columns(3)
         
-        # JSON
-        json_str = json.dumps(st.session_state.resultado, ensure_ascii=False, indent=2)
-        col1.download_button(
-            label="Descargar JSON",
-            data=json_str,
-            file_name=f"transacciones_{st.session_state.timestamp}.json",
-            mime="application/json",
-            key="json_download"
-        )
+        # JSON: se sirve el archivo ya guardado en lugar de volver a serializar en cada rerun
+        if st.session_state.json_path and os.path.exists(st.session_state.json_path):
+            with open(st.session_state.json_path, 'rb') as f:
+                col1.download_button(
+                    label="Descargar JSON",
+                    data=f,
+                    file_name=f"transacciones_{st.session_state.timestamp}.json",
+                    mime="application/json",
+                    key="json_download"
+                )
         
         # LOG
+        # Se entrega el archivo abierto en binario, sin decodificarlo a str en cada rerun
         if st.session_state.log_path and os.path.exists(st.session_state.log_path):
-            with open(st.session_state.log_path, 'r', encoding='utf-8') as f:
-                log_content = f.read()
-            col2.download_button(
-                label="Descargar LOG",
-                data=log_content,
-                file_name=f"procesamiento_{st.session_state.timestamp}.log",
-                mime="text/plain",
-                key="log_download"
-            )
+            with open(st.session_state.log_path, 'rb') as f:
+                col2.download_button(
+                    label="Descargar LOG",
+                    data=f,
+                    file_name=f"procesamiento_{st.session_state.timestamp}.log",
+                    mime="text/plain",
+                    key="log_download"
+                )
         
         # CSV
-        csv = st.session_state.df.to_csv(index=False).encode('utf-8')
         col3.download_button(
             label="Descargar CSV",
-            data=csv,
+            data=st.session_state.csv,
             file_name=f"transacciones_{st.session_state.timestamp}.csv",
             mime="text/csv",
             key="csv_download"